@@ -1,3 +1,4 @@
+import asyncio
 import chainlit as cl
 from dotenv import load_dotenv
 from orchestrator import create_orchestrator
@@ -32,6 +33,13 @@ async def on_chat_start():
     orchestrator = create_orchestrator()
     cl.user_session.set("orchestrator", orchestrator)
 
+    # warm up llm and database off the first message critical path
+    try:
+        prewarm_task = asyncio.create_task(orchestrator.prewarm())
+        cl.user_session.set("prewarm_task", prewarm_task)
+    except Exception as e:
+        print(f"Error starting prewarm: {e}")
+
 @cl.on_message
 async def main(message: cl.Message):
     """Handle messages with orchestrator workflow"""
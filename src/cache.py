@@ -0,0 +1,218 @@
+import os
+import io
+import hashlib
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+try:
+    import diskcache
+except ImportError:  # persistence across restarts is optional
+    diskcache = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # semantic lookup is optional
+    SentenceTransformer = None
+
+CACHE_DIR = os.getenv("WORKFLOW_CACHE_DIR", "./.wf_cache")
+CACHE_MAXSIZE = int(os.getenv("WORKFLOW_CACHE_MAXSIZE", 256))
+CACHE_TTL = int(os.getenv("WORKFLOW_CACHE_TTL", 24 * 60 * 60))
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+
+logger = logging.getLogger()
+
+
+def schema_hash(schema: str) -> str:
+    return hashlib.md5(schema.encode()).hexdigest()
+
+
+def make_key(question: str, schema: str) -> str:
+    """Build cache key from the normalized question and the schema hash"""
+    return hashlib.sha1(
+        (question.strip().lower() + "|" + schema_hash(schema)).encode()
+    ).hexdigest()
+
+
+_embedder = None
+_embedder_failed = False
+_embedder_lock = threading.Lock()
+_embedder_thread = None
+_embedder_thread_lock = threading.Lock()
+
+def load_embedder():
+    """Load the sentence embedding model once per process (blocking)"""
+    global _embedder, _embedder_failed
+    with _embedder_lock:
+        if _embedder is None and not _embedder_failed and SentenceTransformer is not None:
+            try:
+                _embedder = SentenceTransformer(EMBEDDING_MODEL)
+                logger.info(f"Loaded {EMBEDDING_MODEL} for the semantic cache")
+            except Exception as e:
+                # do not retry the download/load on every question
+                logger.warning(f"Semantic cache disabled, failed to load {EMBEDDING_MODEL}: {e}")
+                _embedder_failed = True
+        return _embedder
+
+
+def start_embedder_load():
+    """Load the embedding model in a background thread, if not already started"""
+    global _embedder_thread
+    if SentenceTransformer is None or _embedder is not None or _embedder_failed:
+        return
+    with _embedder_thread_lock:
+        if _embedder_thread is None:
+            _embedder_thread = threading.Thread(
+                target=load_embedder, name="embedder-load", daemon=True
+            )
+            _embedder_thread.start()
+
+
+def get_embedder():
+    """Loaded embedding model, or None while it is loading or unavailable. Never blocks."""
+    if _embedder is None:
+        start_embedder_load()
+    return _embedder
+
+
+@lru_cache(maxsize=32)
+def _encode(question: str) -> np.ndarray | None:
+    try:
+        return _embedder.encode(question.strip(), normalize_embeddings=True)
+    except Exception as e:
+        logger.warning(f"Failed to embed question: {e}")
+        return None
+
+
+def embed(question: str) -> np.ndarray | None:
+    """Normalized question embedding, or None if the model is not ready or unavailable"""
+    if get_embedder() is None:
+        return None
+    return _encode(question)
+
+
+class WorkflowCache:
+    """Process-wide cache of complete workflow responses, by exact or similar question"""
+
+    def __init__(
+        self,
+        maxsize: int = CACHE_MAXSIZE,
+        directory: str = CACHE_DIR,
+        ttl: int = CACHE_TTL,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiration timestamp, payload), oldest used first
+        self._memory = OrderedDict()
+        self._disk = self._open_disk(directory)
+        # schema hash -> (embeddings of shape (N, dim), parallel list of (expiration, payload))
+        self._semantic = {}
+
+    def _open_disk(self, directory):
+        if diskcache is None:
+            return None
+        try:
+            return diskcache.Cache(directory)
+        except Exception as e:
+            logger.warning(f"Disk cache unavailable, using memory only: {e}")
+            return None
+
+    def _remember(self, key: str, payload: dict, expires_at: float):
+        self._memory[key] = (expires_at, payload)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> dict | None:
+        """Get cached payload with the result DataFrame restored, if any"""
+        payload = None
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                payload = None
+            else:
+                self._memory.move_to_end(key)
+
+        if payload is None and self._disk is not None:
+            payload, expires_at = self._disk.get(key, expire_time=True)
+            if payload is not None:
+                self._remember(key, payload, expires_at or time.time() + self.ttl)
+
+        if payload is None:
+            return None
+
+        return self._restore(payload)
+
+    def get_similar(self, question: str, schema: str) -> dict | None:
+        """Get cached payload of the most similar previous question, if close enough"""
+        index = self._semantic.get(schema_hash(schema))
+        if index is None:
+            return None
+
+        emb = embed(question)
+        if emb is None:
+            return None
+
+        embeddings, entries = index
+        sims = embeddings @ emb
+        best = int(sims.argmax())
+        expires_at, payload = entries[best]
+        if sims[best] < SIMILARITY_THRESHOLD or expires_at < time.time():
+            return None
+
+        logger.info(f"Semantic cache hit (similarity {sims[best]:.3f})")
+        return self._restore(payload)
+
+    def _restore(self, payload: dict) -> dict:
+        return {**payload, "result": pd.read_parquet(io.BytesIO(payload["result"]))}
+
+    def _index(self, question: str, schema: str, payload: dict):
+        emb = embed(question)
+        if emb is None:
+            return
+
+        key = schema_hash(schema)
+        entry = (time.time() + self.ttl, payload)
+        if key in self._semantic:
+            embeddings, entries = self._semantic[key]
+            embeddings = np.vstack([embeddings, emb])[-self.maxsize:]
+            entries = (entries + [entry])[-self.maxsize:]
+        else:
+            embeddings, entries = emb[np.newaxis, :], [entry]
+        self._semantic[key] = (embeddings, entries)
+
+    def set(self, key: str, state: dict):
+        """Store query, result, answer, explanation and visualization code"""
+        try:
+            result = state["result"].to_parquet()
+        except Exception as e:
+            logger.warning(f"Could not serialize result for cache: {e}")
+            return
+
+        payload = {
+            "query": state["query"],
+            "result": result,
+            "answer": state["answer"],
+            "explanation": state["explanation"],
+            "dataviz_code": state["dataviz_code"],
+        }
+        self._remember(key, payload, time.time() + self.ttl)
+        if self._disk is not None:
+            self._disk.set(key, payload, expire=self.ttl)
+        self._index(state["question"], state["schema"], payload)
+
+
+# instantiate single global cache
+workflow_cache = WorkflowCache()
+
+def get_cache() -> WorkflowCache:
+    """Get the global WorkflowCache instance"""
+    return workflow_cache
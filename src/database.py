@@ -1,15 +1,35 @@
 import os
+import re
+import json
+import time
 import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
 import pandas as pd
 
 load_dotenv()
 
 GCP_KEY_PATH = os.getenv("GCP_KEY_PATH", "./gcpkey.json")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "creditRisk")
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", 24 * 60 * 60))
+LIMIT_ROWS = int(os.getenv("BQ_LIMIT_ROWS", 10000))
+MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES", 10 * 2**30))
+
+FMT_DESCR = "Nome: {n}, Descrição: {d}, Tipo: {t}, Modo: {m}"
+FMT_FIELD = "Nome: {n}, Tipo: {t}, Modo: {m}"
+
+LIMIT_RE = re.compile(r"\blimit\b", re.IGNORECASE)
+# trailing semicolons, optionally followed by line or block comments, at the end of the query
+TRAILING_SEMICOLON_RE = re.compile(
+    r"(?:\s*;)+((?:\s*(?:(?:--|#)[^\n]*|/\*.*?\*/))*\s*)\Z", re.DOTALL
+)
 
 FIELDS_DESCR = {
     f"{DATABASE_NAME}.train": {
@@ -28,14 +48,25 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 
+def limit_query(query: str) -> str:
+    """Append a default LIMIT to queries that do not set one"""
+    if LIMIT_RE.search(query):
+        return query
+    # drop the statement terminator but keep any comment after it, then add
+    # the LIMIT on a new line so a trailing comment does not swallow it
+    query = TRAILING_SEMICOLON_RE.sub(r"\1", query).rstrip()
+    return f"{query}\nLIMIT {LIMIT_ROWS}"
+
+
 class BigQueryDatabase:
     """BigQuery Database configuration, setup and access"""
 
     def __init__(self, database_name):
         self.database_name = database_name
 
-        self._client, self.project_id = self._create_client()
+        self._client, self._bqstorage, self.project_id = self._create_client()
         self.tables = self._load_tables()
+        self.tables_joined = "\n".join(self.tables)
         self.schemas = self._generate_schemas()
 
     def _create_client(self):
@@ -43,12 +74,23 @@ class BigQueryDatabase:
             if not os.path.exists(GCP_KEY_PATH):
                 raise FileNotFoundError(f"GCP key file not found in {GCP_KEY_PATH}")
 
+            # scoped explicitly, the authorized session below does not get the
+            # scopes bigquery.Client only adds to its own credentials
             credentials = service_account.Credentials.from_service_account_file(
-                GCP_KEY_PATH
+                GCP_KEY_PATH, scopes=bigquery.Client.SCOPE
             )
             project_id = credentials.project_id
 
-            _client = bigquery.Client(credentials=credentials, project=project_id)
+            # shared pooled session, reuses connections instead of a TLS handshake per call
+            session = AuthorizedSession(credentials)
+            session.mount(
+                "https://",
+                HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=3),
+            )
+
+            _client = bigquery.Client(
+                credentials=credentials, project=project_id, _http=session
+            )
 
             logger.info(f"BigQuery client created for project: {project_id}")
 
@@ -56,7 +98,14 @@ class BigQueryDatabase:
             logger.error(f"Failed to create BigQuery client: {e}")
             raise
 
-        return _client, project_id
+        # Storage Read API streams results as Arrow, falls back to REST if unavailable
+        try:
+            _bqstorage = bigquery_storage.BigQueryReadClient(credentials=credentials)
+        except Exception as e:
+            logger.warning(f"BigQuery Storage client unavailable, using REST API: {e}")
+            _bqstorage = None
+
+        return _client, _bqstorage, project_id
 
     def _load_tables(self) -> list:
         """Load and return table names"""
@@ -76,34 +125,78 @@ class BigQueryDatabase:
             logger.error(f"Failed to load tables: {e}")
             return []
 
+    def _load_cached_schemas(self, cache_path: Path) -> str | None:
+        """Return cached schemas if fresh and generated for the same tables"""
+        try:
+            if time.time() - cache_path.stat().st_mtime > SCHEMA_CACHE_TTL:
+                return None
+            with cache_path.open(encoding="utf-8") as f:
+                cached = json.load(f)
+            if (
+                cached["project_id"] != self.project_id
+                or cached["tables"] != self.tables
+                or cached["fields_descr"] != FIELDS_DESCR
+            ):
+                return None
+            logger.info(f"Loaded schemas from {cache_path}")
+            return cached["schemas"]
+
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring schema cache {cache_path}: {e}")
+            return None
+
+    def _save_cached_schemas(self, cache_path: Path, schemas: str):
+        try:
+            with cache_path.open("w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "project_id": self.project_id,
+                        "tables": self.tables,
+                        "fields_descr": FIELDS_DESCR,
+                        "schemas": schemas,
+                    },
+                    f,
+                    ensure_ascii=False,
+                )
+        except Exception as e:
+            logger.warning(f"Failed to write schema cache {cache_path}: {e}")
+
     def _generate_schemas(self):
         """Generates and formats schemas for to provide context"""
-        schemas = []
-        for table_name in self.tables:
-            full_table_name = f"{self.project_id}.{table_name}"
-            table_reference = self._client.get_table(full_table_name)
+        cache_path = Path(f".schema_cache_{self.project_id}_{self.database_name}.json")
+        cached_schemas = self._load_cached_schemas(cache_path)
+        if cached_schemas is not None:
+            return cached_schemas
 
-            schema = [f"Schema for {table_name}:"]
+        # fetch table metadata in parallel instead of one round-trip per table
+        full_table_names = [f"{self.project_id}.{table_name}" for table_name in self.tables]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            table_references = list(executor.map(self._client.get_table, full_table_names))
+
+        out = []
+        for table_name, table_reference in zip(self.tables, table_references):
+            out.append(f"Schema for {table_name}:")
 
             # if DESCR available for table, use only fields with descriptions
-            if table_name in FIELDS_DESCR:
-                for field in table_reference.schema:
-                    field_name = field.name
-                    if field_name in FIELDS_DESCR[table_name]:
-                        description = FIELDS_DESCR[table_name][field_name]
-                        schema.append(
-                            f"Nome: {field_name}, Descrição: {description}, Tipo: {field.field_type}, Modo: {field.mode}"
-                        )
+            descriptions = FIELDS_DESCR.get(table_name)
+            if descriptions is not None:
+                out.extend(
+                    FMT_DESCR.format(n=field.name, d=descriptions[field.name], t=field.field_type, m=field.mode)
+                    for field in table_reference.schema
+                    if field.name in descriptions
+                )
             else:
-                for field in table_reference.schema:
-                    schema.append(
-                        f"Nome: {field.name}, Tipo: {field.field_type}, Modo: {field.mode}"
-                    )
-            schema.append("")
-
-            schemas += schema
+                out.extend(
+                    FMT_FIELD.format(n=field.name, t=field.field_type, m=field.mode)
+                    for field in table_reference.schema
+                )
+            out.append("")
 
-        return "\n".join(schemas)
+        schemas = "\n".join(out)
+        self._save_cached_schemas(cache_path, schemas)
+        return schemas
 
     def get_bq_client(self) -> bigquery.Client:
         """Get BigQuery client if necessary"""
@@ -113,6 +206,10 @@ class BigQueryDatabase:
         """Get list of table names"""
         return self.tables
 
+    def get_tables_joined(self) -> str:
+        """Get table names joined one per line, as used in prompts"""
+        return self.tables_joined
+
     def get_schemas(self) -> str:
         """Get schemas for all tables"""
         return self.schemas
@@ -120,8 +217,16 @@ class BigQueryDatabase:
     def run_query(self, query: str) -> pd.DataFrame:
         """Run SQL query and return results"""
         try:
-            job = self._client.query(query)
-            return job.to_dataframe()
+            job_config = bigquery.QueryJobConfig(
+                use_query_cache=True,
+                maximum_bytes_billed=MAX_BYTES_BILLED,
+            )
+            job = self._client.query(limit_query(query), job_config=job_config)
+            # columnar Arrow-backed DataFrame, strings stay as Arrow arrays
+            table = job.to_arrow(
+                bqstorage_client=self._bqstorage, create_bqstorage_client=False
+            )
+            return table.to_pandas(types_mapper=pd.ArrowDtype, self_destruct=True)
 
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
@@ -1,67 +1,230 @@
+import io
+import ast
+import types
+import asyncio
+from functools import lru_cache
 from typing import Dict, Any
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless server, no GUI backend
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+import pyarrow as pa
 import chainlit as cl
+from viz_helpers import groupby_mean, histogram
 from workflow import (
-    write_query, 
-    execute_query, 
-    generate_answer, 
-    explain_answer, 
-    create_visualization,
+    awrite_query, 
+    aexecute_query, 
+    astream_answer, 
+    astream_explanation, 
+    acreate_visualization,
     handle_no_results,
     get_default_llm,
     get_default_db,
     GraphState
 )
+from cache import make_key, embed, start_embedder_load, get_cache
+
+ARROW_DISPLAY_THRESHOLD = 1_000_000  # bytes of display data before sending Arrow
+ARROW_PREVIEW_ROWS = 10
+
+# Best-effort guard against obvious escape hatches in LLM generated code, not a
+# security sandbox: the code still runs in-process with numpy/pandas/matplotlib.
+# Modules are allowlisted by full path, for import statements and for attribute
+# access at runtime, so np.lib.npyio or pd.io.common cannot be reached even
+# through an alias. Names below are rejected wherever they appear.
+VIZ_MODULES = {
+    "matplotlib", "matplotlib.pyplot", "matplotlib.cm", "matplotlib.colors",
+    "matplotlib.dates", "matplotlib.gridspec", "matplotlib.lines",
+    "matplotlib.patches", "matplotlib.ticker",
+    "numpy", "numpy.random", "numpy.linalg",
+    "pandas", "pandas.api", "pandas.api.types", "pandas.plotting",
+    "seaborn",
+}
+VIZ_PACKAGES = {name.split(".")[0] for name in VIZ_MODULES}
+VIZ_BLOCKED_NAMES = {
+    # interpreter and process access
+    "os", "sys", "subprocess", "builtins", "ctypes", "ctypeslib", "f2py",
+    # code evaluation
+    "eval", "exec", "query", "compile",
+    # file and network I/O, pickle deserialization
+    "open", "load", "loads", "save", "savez", "savetxt", "loadtxt", "genfromtxt",
+    "fromfile", "fromregex", "tofile", "memmap", "open_memmap", "npyio",
+    "DataSource", "get_handle", "ExcelFile", "ExcelWriter", "HDFStore",
+    "savefig", "imsave", "imread", "load_dataset",
+}
+# to_* methods that only convert values; every other to_* may write a file
+VIZ_ALLOWED_CONVERSIONS = {
+    "to_numpy", "to_list", "to_dict", "to_frame", "to_records", "to_series",
+    "to_datetime", "to_numeric", "to_timedelta", "to_period", "to_timestamp",
+    "to_pydatetime", "to_flat_index", "to_rgb", "to_rgba", "to_hex",
+}
+VIZ_BLOCKED_PREFIXES = ("__", "read_", "print_")
+
+
+def _check_viz_name(name: str):
+    if (
+        name.startswith(VIZ_BLOCKED_PREFIXES)
+        or name in VIZ_BLOCKED_NAMES
+        or (name.startswith("to_") and name not in VIZ_ALLOWED_CONVERSIONS)
+    ):
+        raise ValueError(f"Access to '{name}' is not allowed in visualization code")
+
+
+def _check_viz_module(value):
+    if isinstance(value, types.ModuleType) and value.__name__ not in VIZ_MODULES:
+        raise ValueError(f"Access to module '{value.__name__}' is not allowed in visualization code")
+    return value
+
+
+def _viz_getattr(obj, name: str):
+    _check_viz_name(name)
+    return _check_viz_module(getattr(obj, name))
+
+
+def _check_viz_import(name: str):
+    if name not in VIZ_MODULES:
+        raise ImportError(f"Import of '{name}' is not allowed in visualization code")
+
+
+def _viz_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # numpy/pandas internals imported lazily from C also land here, so only the
+    # package is checked at runtime, full paths are checked in _compile_viz
+    if level != 0 or name.split(".")[0] not in VIZ_PACKAGES:
+        raise ImportError(f"Import of '{name}' is not allowed in visualization code")
+    module = __import__(name, globals, locals, fromlist, level)
+    for item in fromlist or ():
+        try:
+            _check_viz_module(getattr(module, item, None))
+        except ValueError as e:
+            raise ImportError(str(e)) from None
+    return module
+
+
+VIZ_BUILTINS = {
+    "range": range, "len": len, "min": min, "max": max, "sum": sum, "abs": abs,
+    "round": round, "sorted": sorted, "reversed": reversed, "zip": zip,
+    "enumerate": enumerate, "map": map, "filter": filter, "any": any, "all": all,
+    "isinstance": isinstance, "print": print, "list": list, "dict": dict,
+    "tuple": tuple, "set": set, "str": str, "float": float, "int": int,
+    "bool": bool, "Exception": Exception, "ValueError": ValueError,
+    "KeyError": KeyError, "TypeError": TypeError, "__import__": _viz_import,
+    "__viz_getattr__": _viz_getattr,
+}
+
+
+class _GuardAttributes(ast.NodeTransformer):
+    """Route every attribute read through _viz_getattr"""
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.ctx, ast.Load):
+            return node
+        call = ast.Call(
+            func=ast.Name(id="__viz_getattr__", ctx=ast.Load()),
+            args=[node.value, ast.Constant(node.attr)],
+            keywords=[],
+        )
+        return ast.copy_location(call, node)
+
+
+@lru_cache(maxsize=256)
+def _compile_viz(code: str):
+    """Compile LLM generated visualization code.
+
+    Raises ValueError on blocked names and ImportError on modules outside VIZ_MODULES.
+    """
+    tree = ast.parse(code, "<viz>", "exec")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            _check_viz_name(node.attr)
+        elif isinstance(node, ast.Name):
+            _check_viz_name(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [node.module or ""] if isinstance(node, ast.ImportFrom) else []
+            for name in modules + [alias.name for alias in node.names]:
+                for part in name.split("."):
+                    _check_viz_name(part)
+            for name in modules or [alias.name for alias in node.names]:
+                _check_viz_import(name)
+    tree = ast.fix_missing_locations(_GuardAttributes().visit(tree))
+    return compile(tree, "<viz>", "exec")
+
+
+def to_arrow_ipc(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to the Arrow IPC file format"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    buffer = io.BytesIO()
+    with pa.ipc.new_file(buffer, table.schema) as writer:
+        writer.write_table(table)
+    return buffer.getvalue()
+
 
 def create_plot_figures(code: str, result_df: pd.DataFrame) -> list:
-    """Execute visualization code and return a list of matplotlib figures."""
-    try:
-        figs = []
-        exec_globals = {
-            'plt': plt,
-            'pd': pd,
-            'sns': sns,
-            'np': np,
-            'df': result_df,
-            'figs': figs,
-        }
-        
-        initial_figures_count = len(plt.get_fignums())
+    """Execute visualization code and return a list of matplotlib figures.
+
+    Errors from rejected or failing code are raised so they can be shown to the user.
+    """
+    figs = []
+    exec_globals = {
+        '__builtins__': VIZ_BUILTINS,
+        'plt': plt,
+        'pd': pd,
+        'sns': sns,
+        'np': np,
+        'df': result_df,
+        'figs': figs,
+        'gb_mean': groupby_mean,
+        'histogram': histogram,
+    }
+    
+    initial_figures_count = len(plt.get_fignums())
 
-        exec(code, exec_globals)
+    try:
+        exec(_compile_viz(code), exec_globals)
         current_figures = [plt.figure(fignum) for fignum in plt.get_fignums() if fignum >= initial_figures_count]
         
-        all_figs = list(set(figs + current_figures))
-        
-        for fig in current_figures:
-            plt.close(fig)
+        # dedup by identity, keeping the order figures were created in
+        return list({id(fig): fig for fig in figs + current_figures}.values())
 
-        return all_figs
-        
-    except Exception as e:
-        print(f"Error creating visualization: {e}")
-        return []
+    finally:
+        for fignum in plt.get_fignums():
+            if fignum >= initial_figures_count:
+                plt.close(fignum)
 
 
 class WorkflowOrchestrator:
     """Orchestrates workflow manually and callbacks to chainlit"""
     
-    def __init__(self, llm=None, db=None):
+    def __init__(self, llm=None, db=None, cache=None):
         self.llm = llm or get_default_llm()
         self.db = db or get_default_db()
+        self.cache = cache or get_cache()
         self.state = GraphState()
                 
+    async def prewarm(self):
+        """Warm up the LLM client, BigQuery connection and semantic cache model"""
+        start_embedder_load()
+        results = await asyncio.gather(
+            self.llm.ainvoke("ping"),
+            asyncio.to_thread(self.db.run_query, "SELECT 1"),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error prewarming workflow: {result}")
+
     def initialize_state(self, question: str) -> Dict[str, Any]:
         """Initialize the workflow state"""
         self.state = GraphState(
             tables=self.db.get_tables(),
+            tables_joined=self.db.get_tables_joined(),
             schema=self.db.get_schemas(),
             question=question,
             query="",
             result="",
+            result_for_llm="",
             answer="",
             explanation="",
             dataviz_code="",
@@ -70,30 +233,31 @@ class WorkflowOrchestrator:
         return self.state.copy()
     
     
-    def step_write_query(self) -> Dict[str, Any]:
-        result = write_query(self.state, self.llm)
+    async def step_write_query(self) -> Dict[str, Any]:
+        result = await awrite_query(self.state, self.llm)
         self.state.update(result)
         return result['query']
     
-    def step_execute_query(self) -> Dict[str, Any]:
-        result = execute_query(self.state, self.db)
+    async def step_execute_query(self) -> Dict[str, Any]:
+        result = await aexecute_query(self.state, self.db)
         self.state.update(result)
         return result['result']
     
-    def step_generate_answer(self) -> Dict[str, Any]:
-        result = generate_answer(self.state, self.llm)
-        self.state.update(result)
-        return result['answer']
+    async def step_generate_answer(self, message: cl.Message) -> str:
+        async for token in astream_answer(self.state, self.llm):
+            await message.stream_token(token)
+        self.state["answer"] = message.content.strip()
+        return self.state["answer"]
     
-    def step_explain_answer(self) -> Dict[str, Any]:
-        
-        result = explain_answer(self.state, self.llm)
-        self.state.update(result)
-        return result['explanation']
+    async def step_explain_answer(self, step: cl.Step) -> str:
+        async for token in astream_explanation(self.state, self.llm):
+            await step.stream_token(token)
+        self.state["explanation"] = step.output.strip()
+        return self.state["explanation"]
     
-    def step_create_visualization(self) -> Dict[str, Any]:
+    async def step_create_visualization(self) -> Dict[str, Any]:
         
-        result = create_visualization(self.state, self.llm)
+        result = await acreate_visualization(self.state, self.llm)
         self.state.update(result)
         return result['dataviz_code']
     
@@ -104,8 +268,135 @@ class WorkflowOrchestrator:
         return result['answer']
 
 
+    def is_cacheable(self) -> bool:
+        """Only complete, error-free responses are worth caching"""
+        return (
+            self.state.get("has_results", False)
+            and "Error generating answer" not in self.state["answer"]
+            and "Error generating explanation" not in self.state["explanation"]
+            and not self.state["dataviz_code"].startswith("# Error")
+        )
+
+    async def send_results(self, result_df: pd.DataFrame):
+        """Send the query results table"""
+        if not result_df.empty:
+            display_df = result_df.head(100)
+            message_content = f"## Resultados da query{' (mostrando as primeiras 100 linhas):' if len(result_df) > 100 else ':'}"
+
+            # large tables are cheaper to send as Arrow than as the JSON behind cl.Dataframe
+            if display_df.memory_usage(deep=True).sum() > ARROW_DISPLAY_THRESHOLD:
+                try:
+                    elements = [
+                        cl.Dataframe(data=display_df.head(ARROW_PREVIEW_ROWS), display="inline"),
+                        cl.File(
+                            name="resultados.arrow",
+                            content=to_arrow_ipc(display_df),
+                            mime="application/vnd.apache.arrow.file",
+                            display="inline",
+                        ),
+                    ]
+                    message_content += f"\nPrévia das primeiras {ARROW_PREVIEW_ROWS} linhas, tabela completa no arquivo Arrow."
+                    await cl.Message(content=message_content, elements=elements).send()
+                    return
+                except Exception as e:
+                    print(f"Error serializing results to Arrow: {e}")
+
+            elements = [cl.Dataframe(data=display_df, display="inline")]
+            await cl.Message(content=message_content, elements=elements).send()
+
+    async def send_visualization(self, dataviz_code: str, result_df: pd.DataFrame) -> list:
+        """Run visualization code, send the resulting figures and return them"""
+        if not (isinstance(result_df, pd.DataFrame) and dataviz_code.strip()):
+            await cl.Message(content="Não foi possível gerar visualização: Código vazio.").send()
+            return []
+
+        try:
+            figs = create_plot_figures(dataviz_code, result_df)
+        except Exception as viz_error:
+            await cl.Message(
+                content=f"Erro na Visualização\n{viz_error}"
+            ).send()
+            return []
+
+        if figs:
+            elements = []
+            for i, fig in enumerate(figs):
+                elements.append(cl.Pyplot(
+                    name=f"visualization_{i}",
+                    figure=fig,
+                    display="inline",
+                ))
+            await cl.Message(
+                content="## Visualização dos Dados",
+                elements=elements
+            ).send()
+        else:
+            await cl.Message(
+                content="Erro na Visualização\nNenhuma figura foi gerada pelo código de visualização."
+            ).send()
+        return figs
+
+    async def replay_cached_workflow(self, question: str, cached: Dict[str, Any]):
+        """Send a cached response reproducing the workflow steps"""
+        self.initialize_state(question)
+        self.state.update(cached)
+        self.state["has_results"] = True
+        result_df = self.state["result"]
+
+        async with cl.Step(name="geração da query SQL") as step:
+            step.output = f"Query SQL gerada (cache):\n```sql\n{self.state['query']}\n```"
+            await step.update()
+
+        async with cl.Step(name="execução da query SQL") as step:
+            step.output = f"Resultado recuperado do cache, {len(result_df)} registro(s) encontrados."
+            await step.update()
+
+        await self.send_results(result_df)
+        await cl.Message(content=self.state["answer"]).send()
+
+        async with cl.Step(name="explicação da query") as step:
+            step.output = self.state["explanation"]
+            await step.update()
+
+        async with cl.Step(name="criação da visualização") as step:
+            step.output = f"```python\n{self.state['dataviz_code']}\n```"
+            await step.update()
+
+        await self.send_visualization(self.state["dataviz_code"], result_df)
+
+    async def run_explain_step(self) -> str:
+        """Step 4: explain query"""
+        async with cl.Step(name="explicação da query") as step:
+            step.output = ""
+            explanation_result = await self.step_explain_answer(step)
+            await step.update()
+        return explanation_result
+
+    async def run_visualization_step(self) -> str:
+        """Step 5: create visualization"""
+        async with cl.Step(name="criação da visualização") as step:
+            step.output = "Gerando código de visualização dos dados..."
+            await step.update()
+
+            dataviz_code = await self.step_create_visualization()
+            step.output = f"```python\n{dataviz_code}\n```"
+            await step.update()
+        return dataviz_code
+
     async def run_chainlit_workflow(self, question: str):
         """Run the complete workflow and send chainlit messages"""
+        cache_key = make_key(question, self.db.get_schemas())
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            # encoding runs in a worker thread and returns None until the model
+            # finished loading in the background; get_similar and cache.set
+            # reuse the memoized embedding
+            await asyncio.to_thread(embed, question)
+            cached = self.cache.get_similar(question, self.db.get_schemas())
+        if cached is not None:
+            await self.replay_cached_workflow(question, cached)
+            return
+
         self.initialize_state(question)
         
         # step 1: query generation
@@ -113,7 +404,7 @@ class WorkflowOrchestrator:
             step.output = "Gerando consulta SQL..." 
             await step.update()
 
-            query_result = self.step_write_query()
+            query_result = await self.step_write_query()
 
             step.output = f"Query SQL gerada:\n```sql\n{query_result}\n```"
             await step.update()
@@ -123,7 +414,7 @@ class WorkflowOrchestrator:
             step.output = "Executando consulta SQL..."
             await step.update()
 
-            execute_result = self.step_execute_query()
+            execute_result = await self.step_execute_query()
             if self.state.get("has_results", False):
                 step.output = f"Query executada com sucesso, {len(execute_result)} registro(s) encontrados."
             else:
@@ -134,69 +425,27 @@ class WorkflowOrchestrator:
             
             # send results
             result_df = self.state.get("result")
-            if not result_df.empty:
-                display_df = result_df.head(100)
-                elements = [cl.Dataframe(data=display_df, display="inline")]
-                message_content = f"## Resultados da query{' (mostrando as primeiras 100 linhas):' if len(result_df) > 100 else ':'}"
-                await cl.Message(content=message_content, elements=elements).send()
-
-            # step 3 : interpret results
-            async with cl.Step(name="interpretação dos resultados") as step:
-                step.output = "Interpretando resultados..."
-                await step.update()
-                answer_result = self.step_generate_answer()                
-                await step.remove()
-
-            await cl.Message(content=answer_result).send()
-
-            # step 4: explain query
-            async with cl.Step(name="explicação da query") as step:
-                step.output = "Explicando a consulta SQL..."
-                await step.update()
-                explanation_result = self.step_explain_answer()
-
-                step.output = explanation_result
-                await step.update()
-            
-            # step 5: create visualization
-            async with cl.Step(name="criação da visualização") as step:
-                step.output = "Gerando código de visualização dos dados..."
-                await step.update()
+            await self.send_results(result_df)
 
-                dataviz_code = self.step_create_visualization()
-                step.output = f"```python\n{dataviz_code}\n```"
-                await step.update()
+            # step 3 : interpret results, streaming the answer as it is generated
+            answer_message = cl.Message(content="")
+            await self.step_generate_answer(answer_message)
+            await answer_message.send()
 
-            if isinstance(result_df, pd.DataFrame) and dataviz_code.strip():
-                try:
-                    figs = create_plot_figures(dataviz_code, result_df)
-                    
-                    if figs:
-                        elements = []
-                        for i, fig in enumerate(figs):
-                            elements.append(cl.Pyplot(
-                                name=f"visualization_{i}",
-                                figure=fig,
-                                display="inline",
-                            ))
-                        await cl.Message(
-                            content="## Visualização dos Dados",
-                            elements=elements
-                        ).send()
-                    else:
-                        await cl.Message(
-                            content="Erro na Visualização\nNenhuma figura foi gerada pelo código de visualização."
-                        ).send()
-                except Exception as viz_error:
-                    await cl.Message(
-                        content=f"Erro na Visualização\n{viz_error}"
-                    ).send()
-            else:
-                await cl.Message(content="Não foi possível gerar visualização: Código vazio.").send()
+            # steps 4 and 5 do not depend on each other, run them concurrently
+            _, dataviz_code = await asyncio.gather(
+                self.run_explain_step(),
+                self.run_visualization_step(),
+            )
+
+            # only cache responses whose visualization actually produced figures
+            figs = await self.send_visualization(dataviz_code, result_df)
+            if figs and self.is_cacheable():
+                self.cache.set(cache_key, self.state)
         else:            
             no_results_result = self.step_handle_no_results()
             await cl.Message(content=no_results_result).send()
 
-def create_orchestrator(llm=None, db=None) -> WorkflowOrchestrator:
+def create_orchestrator(llm=None, db=None, cache=None) -> WorkflowOrchestrator:
     """Create a new workflow orchestrator instance"""
-    return WorkflowOrchestrator(llm, db)
\ No newline at end of file
+    return WorkflowOrchestrator(llm, db, cache)
\ No newline at end of file
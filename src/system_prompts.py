@@ -1,5 +1,6 @@
 from langchain_core.prompts import ChatPromptTemplate
 
+# static instructions first and dynamic context last, keeping the prompt prefix cacheable
 write_query_system_prompt = """Você é um especialista em SQL que cria consultas precisas baseadas em esquemas de banco de dados.
 TAREFA:
 Criar uma consulta SQL sintaticamente correta para responder à pergunta do usuário.
@@ -10,14 +11,14 @@ REGRAS OBRIGATÓRIAS:
 - Ordene resultados por colunas relevantes quando apropriado
 - Utilze AS para renomear colunas e apresentar resultados mais claros
 
+FORMATO DE RESPOSTA:
+Retorne apenas a consulta SQL válida, sem comentários ou explicações.
+
 TABELAS DISPONÍVEIS:
 {tables}
 
 SCHEMAS DETALHADOS:
-{schema}
-
-FORMATO DE RESPOSTA:
-Retorne apenas a consulta SQL válida, sem comentários ou explicações."""
+{schema}"""
 
 
 answer_system_prompt = ChatPromptTemplate([
@@ -68,6 +69,11 @@ Você tem acesso a um DataFrame 'df' e deve adicionar figuras à lista 'figs'.
 
 REGRAS:
 - Utilize APENAS Matplotlib e Pandas
+- plt, pd, sns e np já estão disponíveis no ambiente; não importe outros módulos
+- NÃO leia nem salve arquivos (plt.savefig, read_*, to_csv etc.); apenas adicione as figuras a 'figs'
+- Para agregações numéricas prefira as funções já disponíveis em vez de laços ou df.apply:
+  - gb_mean(chaves, valores) -> (chaves_unicas, medias): média de valores por chave
+  - histogram(valores, bins=10) -> (contagens, limites): histograma ignorando nulos e infinitos
 - SEMPRE adicione a figura à lista 'figs' usando figs.append(fig)
 - Utilize SOMENTE as colunas presentes no DataFrame 'df' que você JÁ POSSUI em ambiente
 - Tome cuidado para NÃO usar valores 'None'
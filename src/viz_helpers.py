@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, numpy fallbacks are used instead
+    njit = None
+
+
+def _as_float_array(values) -> np.ndarray:
+    return pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _grouped_sums_loop(codes, values, n_groups):
+    sums = np.zeros(n_groups)
+    counts = np.zeros(n_groups, dtype=np.int64)
+    for i in range(codes.shape[0]):
+        code = codes[i]
+        value = values[i]
+        if code < 0 or np.isnan(value):
+            continue
+        sums[code] += value
+        counts[code] += 1
+    return sums, counts
+
+
+def _bin_counts_loop(values, edges):
+    # same binning as np.histogram: half-open bins, last bin includes the max
+    bins = edges.shape[0] - 1
+    counts = np.zeros(bins, dtype=np.int64)
+    low = edges[0]
+    width = edges[-1] - low
+    for i in range(values.shape[0]):
+        value = values[i]
+        if np.isnan(value) or value < low or value > edges[-1]:
+            continue
+        index = min(int((value - low) / width * bins), bins - 1)
+        # correct float rounding against the actual edges
+        if value < edges[index]:
+            index -= 1
+        elif index < bins - 1 and value >= edges[index + 1]:
+            index += 1
+        counts[index] += 1
+    return counts
+
+
+def _grouped_sums_numpy(codes, values, n_groups):
+    mask = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[mask], weights=values[mask], minlength=n_groups)
+    counts = np.bincount(codes[mask], minlength=n_groups)
+    return sums, counts
+
+
+def _bin_counts_numpy(values, edges):
+    counts, _ = np.histogram(values[~np.isnan(values)], bins=edges)
+    return counts
+
+
+if njit is not None:
+    _grouped_sums = njit(cache=True)(_grouped_sums_loop)
+    _bin_counts = njit(cache=True)(_bin_counts_loop)
+else:
+    _grouped_sums = _grouped_sums_numpy
+    _bin_counts = _bin_counts_numpy
+
+
+def groupby_mean(keys, values) -> tuple:
+    """Mean of values per key, returns (sorted unique keys, means)"""
+    codes, uniques = pd.factorize(pd.Series(keys), sort=True)
+    sums, counts = _grouped_sums(
+        codes.astype(np.int64), _as_float_array(values), len(uniques)
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return np.asarray(uniques), means
+
+
+def histogram(values, bins: int = 10) -> tuple:
+    """Histogram of values ignoring nulls and infinities, returns (counts, bin edges)"""
+    values = _as_float_array(values)
+    valid = values[np.isfinite(values)]
+    if valid.size == 0:
+        return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+    low, high = valid.min(), valid.max()
+    if low == high:  # same range np.histogram uses for a single value
+        low, high = low - 0.5, high + 0.5
+    edges = np.linspace(low, high, bins + 1)
+    return _bin_counts(valid, edges), edges
@@ -4,8 +4,13 @@ from langgraph.graph import StateGraph, END
 from langchain.chat_models import init_chat_model
 
 import os
+import re
+import json
+import asyncio
+from functools import lru_cache
 from typing import TypedDict
 from dotenv import load_dotenv
+import pandas as pd
 
 from database import get_instance
 from system_prompts import (
@@ -17,6 +22,9 @@ from system_prompts import (
 
 load_dotenv()
 
+_FENCE_RE = re.compile(r"^\s*```(?:sql|python)?\s*\n?(.*?)\n?```\s*$", re.DOTALL | re.IGNORECASE)
+
+@lru_cache(maxsize=None)
 def get_default_llm():
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -27,53 +35,131 @@ def get_default_db():
     return get_instance()
 
 
+write_query_prompt = ChatPromptTemplate(
+    [("system", write_query_system_prompt), ("user", "Pergunta: {question}")]
+)
+
+# (prompt name, id(llm)) -> (llm, chain); llm is kept so its id is not reused
+_chains = {}
+
+def get_chain(name: str, prompt: ChatPromptTemplate, llm):
+    """Get the prompt | llm | parser chain, built once per prompt and llm"""
+    key = (name, id(llm))
+    cached = _chains.get(key)
+    if cached is None or cached[0] is not llm:
+        cached = (llm, prompt | llm | StrOutputParser())
+        _chains[key] = cached
+    return cached[1]
+
+
 class GraphState(TypedDict):
     tables: list
+    tables_joined: str
     schema: str
     question: str
     query: str
     result: str
+    result_for_llm: str
     answer: str
     explanation: str
     dataviz_code: str
     has_results: bool
 
 
+def _write_query_inputs(state: GraphState) -> dict:
+    return {
+        "question": state["question"],
+        "tables": state.get("tables_joined") or "\n".join(state["tables"]),
+        "schema": state["schema"],
+    }
+
+
+def strip_code_fence(text: str) -> str:
+    """Remove a markdown code block around the llm output, if any"""
+    m = _FENCE_RE.match(text)
+    text = m.group(1) if m else text
+    return text.strip()
+
+
 def write_query(state: GraphState, llm=None) -> dict:
     """Generate SQL query based on the question and schema"""
 
     if llm is None:
         llm = get_default_llm()
 
-    user_prompt = "Pergunta: {question}"
+    chain = get_chain("write_query", write_query_prompt, llm)
 
-    query_prompt = ChatPromptTemplate(
-        [("system", write_query_system_prompt), ("user", user_prompt)]
-    )
+    try:
+        query = chain.invoke(_write_query_inputs(state))
 
-    chain = query_prompt | llm | StrOutputParser()
+        return {"query": strip_code_fence(query)}
 
-    try:
-        query = chain.invoke(
-            {
-                "question": state["question"],
-                "tables": "\n".join(state["tables"]),
-                "schema": state["schema"],
-            }
-        )
+    except Exception as e:
+        print(f"Error generating query: {e}")
+        raise Exception({"query": f"-- Error generating query: {e}"})
+
+
+async def awrite_query(state: GraphState, llm=None) -> dict:
+    """Async version of write_query"""
+
+    if llm is None:
+        llm = get_default_llm()
 
-        # check if llm used code blocks
-        query = query.strip()
-        if query.startswith("```sql"):
-            query = query.replace("```sql", "").replace("```", "").strip()
+    chain = get_chain("write_query", write_query_prompt, llm)
 
-        return {"query": query}
+    try:
+        query = await chain.ainvoke(_write_query_inputs(state))
+
+        return {"query": strip_code_fence(query)}
 
     except Exception as e:
         print(f"Error generating query: {e}")
         raise Exception({"query": f"-- Error generating query: {e}"})
 
 
+def build_compact_result_ctx(df, sample_rows: int = 5, max_columns: int = 20) -> str:
+    """Summarize a large result as JSON: columns, types, size, sample and statistics"""
+    shown = df.iloc[:, :max_columns]
+    describe = {}
+    for position, col in enumerate(shown.columns):
+        try:
+            stats = shown.iloc[:, position].describe()
+        except Exception:  # e.g. pyarrow decimal columns, skip only this column
+            continue
+        describe[col] = {stat: value for stat, value in stats.items() if pd.notna(value)}
+
+    return json.dumps(
+        {
+            "columns": list(shown.columns),
+            "column_count": df.shape[1],
+            "dtypes": {col: str(dtype) for col, dtype in shown.dtypes.items()},
+            "row_count": len(df),
+            "sample": shown.head(sample_rows).to_dict(orient="records"),
+            "describe": describe,
+        },
+        default=str,
+        ensure_ascii=False,
+    )
+
+
+def format_result_for_llm(result_df) -> str:
+    """Render the query result once for the answer and explanation prompts"""
+    if len(result_df) > 100: # prevent big context sizes
+        return f"Resumo do resultado ({len(result_df)} linhas):\n{build_compact_result_ctx(result_df)}"
+    return result_df.to_string()
+
+
+def _query_result(result_df) -> dict:
+    if not result_df.empty and result_df.notna().values.any():
+        return {
+            "result": result_df,
+            "result_for_llm": format_result_for_llm(result_df),
+            "has_results": True,
+        }
+    else:
+        return {"result": "Nenhum resultado encontrado.", "has_results": False}
+
+
 def execute_query(state: GraphState, db=None) -> dict:
     """Execute the generated SQL query"""
     
@@ -82,40 +168,46 @@ def execute_query(state: GraphState, db=None) -> dict:
 
     try:
         result_df = db.run_query(state["query"])
+        return _query_result(result_df)
+
+    except Exception as e:
+        error_msg = f"Error executing query: {e}"
+        return {"result": error_msg, "has_results": False}
+
+
+async def aexecute_query(state: GraphState, db=None) -> dict:
+    """Execute the generated SQL query in a worker thread"""
+    
+    if db is None:
+        db = get_default_db()
 
-        if (not result_df.empty) and len(result_df) > 0 and not result_df.isnull().all().all():
-            return {"result": result_df, "has_results": True}
-        else:
-            return {"result": "Nenhum resultado encontrado.", "has_results": False}
+    try:
+        result_df = await asyncio.to_thread(db.run_query, state["query"])
+        return _query_result(result_df)
 
     except Exception as e:
         error_msg = f"Error executing query: {e}"
         return {"result": error_msg, "has_results": False}
 
 
+def _answer_inputs(state: GraphState) -> dict:
+    return {
+        "question": state["question"],
+        "query": state["query"],
+        "result": state["result_for_llm"],
+    }
+
+
 def generate_answer(state: GraphState, llm=None) -> dict:
     """Generate a natural language answer based on the query results"""
     
     if llm is None:
         llm = get_default_llm()
 
-    chain = answer_system_prompt | llm | StrOutputParser()
+    chain = get_chain("answer", answer_system_prompt, llm)
 
     try:
-        result_str = str(state["result"])
-        if len(result_str) > 10000: # prevent big context sizes
-            truncated_result = state["result"].head(100).to_string()
-            result_for_llm = f"Resultado truncado (primeiras 100 linhas de {len(state['result'])} total):\n{truncated_result}"
-        else:
-            result_for_llm = state["result"]
-
-        answer = chain.invoke(
-            {
-                "question": state["question"],
-                "query": state["query"],
-                "result": result_for_llm,
-            }
-        )
+        answer = chain.invoke(_answer_inputs(state))
 
         return {"answer": answer.strip()}
 
@@ -123,30 +215,41 @@ def generate_answer(state: GraphState, llm=None) -> dict:
         return {"answer": f"Error generating answer: {e}"}
 
 
+async def astream_answer(state: GraphState, llm=None):
+    """Stream the answer tokens as they are generated"""
+    
+    if llm is None:
+        llm = get_default_llm()
+
+    chain = get_chain("answer", answer_system_prompt, llm)
+
+    try:
+        async for token in chain.astream(_answer_inputs(state)):
+            yield token
+
+    except Exception as e:
+        yield f"Error generating answer: {e}"
+
+
+def _explain_inputs(state: GraphState) -> dict:
+    return {
+        "question": state["question"],
+        "query": state["query"],
+        "result": state["result_for_llm"],  # Use processed result instead of raw DataFrame
+        "answer": state["answer"],
+    }
+
+
 def explain_answer(state: GraphState, llm=None) -> dict:
     """Provides an explanation of how the answer was derived"""
     
     if llm is None:
         llm = get_default_llm()
 
-    chain = explain_system_prompt | llm | StrOutputParser()
+    chain = get_chain("explain", explain_system_prompt, llm)
 
     try:
-        result_str = str(state["result"])
-        if len(result_str) > 10000: # prevent big context sizes
-            truncated_result = state["result"].head(100).to_string()
-            result_for_llm = f"Resultado truncado (primeiras 100 linhas de {len(state['result'])} total):\n{truncated_result}"
-        else:
-            result_for_llm = state["result"]
-
-        explanation = chain.invoke(
-            {
-                "question": state["question"],
-                "query": state["query"],
-                "result": result_for_llm,  # Use processed result instead of raw DataFrame
-                "answer": state["answer"],
-            }
-        )
+        explanation = chain.invoke(_explain_inputs(state))
 
         return {"explanation": explanation.strip()}
 
@@ -154,40 +257,68 @@ def explain_answer(state: GraphState, llm=None) -> dict:
         return {"explanation": f"Error generating explanation: {e}"}
 
 
+async def astream_explanation(state: GraphState, llm=None):
+    """Stream the explanation tokens as they are generated"""
+    
+    if llm is None:
+        llm = get_default_llm()
+
+    chain = get_chain("explain", explain_system_prompt, llm)
+
+    try:
+        async for token in chain.astream(_explain_inputs(state)):
+            yield token
+
+    except Exception as e:
+        yield f"Error generating explanation: {e}"
+
+
+def _visualization_inputs(state: GraphState) -> dict:
+    if not state["result"].empty:
+        columns = [f"'{col}', " for col in state["result"].columns]
+        sample_data = state["result"].head(5).to_string()
+        result_for_viz = f"Amostra dos dados (5 primeiras linhas):\n{sample_data}"
+    else:
+        columns = "No columns available"
+        result_for_viz = str(state["result"])
+
+    return {
+        "question": state["question"],
+        "query": state["query"],
+        "result": result_for_viz,
+        "columns": columns,
+    }
+
+
 def create_visualization(state: GraphState, llm=None) -> dict:
     """Generates matplotlib code to visualize the results"""
     
     if llm is None:
         llm = get_default_llm()
 
-    chain = dataviz_system_prompt | llm | StrOutputParser()
+    chain = get_chain("dataviz", dataviz_system_prompt, llm)
+
+    try:
+        visualization_code = chain.invoke(_visualization_inputs(state))
+
+        return {"dataviz_code": strip_code_fence(visualization_code)}
+
+    except Exception as e:
+        return {"dataviz_code": f"# Error: {e}"}
+
+
+async def acreate_visualization(state: GraphState, llm=None) -> dict:
+    """Async version of create_visualization"""
+    
+    if llm is None:
+        llm = get_default_llm()
+
+    chain = get_chain("dataviz", dataviz_system_prompt, llm)
 
     try:
-        if not state["result"].empty:
-            columns = [f"'{col}', " for col in state["result"].columns]
-            sample_data = state["result"].head(5).to_string()
-            result_for_viz = f"Amostra dos dados (5 primeiras linhas):\n{sample_data}"
-        else:
-            columns = "No columns available"
-            result_for_viz = str(state["result"])
-
-        visualization_code = chain.invoke(
-            {
-                "question": state["question"],
-                "query": state["query"],
-                "result": result_for_viz,
-                "columns": columns,
-            }
-        )
-
-        # check if llm used code blocks
-        visualization_code = visualization_code.strip()
-        if visualization_code.startswith("```python"):
-            visualization_code = (
-                visualization_code.replace("```python", "").replace("```", "").strip()
-            )
-
-        return {"dataviz_code": visualization_code.strip()}
+        visualization_code = await chain.ainvoke(_visualization_inputs(state))
+
+        return {"dataviz_code": strip_code_fence(visualization_code)}
 
     except Exception as e:
         return {"dataviz_code": f"# Error: {e}"}
@@ -248,10 +379,12 @@ if __name__ == "__main__":
 
     initial_state = {
         "tables": db.get_tables(),
+        "tables_joined": db.get_tables_joined(),
         "schema": db.get_schemas(),
         "question": "Quais os 10 estados com mais mulheres?",
         "query": "",
         "result": "",
+        "result_for_llm": "",
         "answer": "",
         "explanation": "",
         "dataviz_code": "",
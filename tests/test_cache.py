@@ -0,0 +1,224 @@
+import unittest
+from unittest.mock import Mock, patch
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import cache
+from cache import WorkflowCache, make_key
+
+
+class TestWorkflowCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        # keep the semantic index out of the exact-match tests
+        patcher = patch('cache.embed', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_state(self, question="Test question"):
+        return {
+            "schema": "Schema test",
+            "question": question,
+            "query": "SELECT * FROM test",
+            "result": pd.DataFrame({"uf": ["SP", "RJ"], "media": [35.5, 40.0]}),
+            "answer": "Test answer",
+            "explanation": "Test explanation",
+            "dataviz_code": "plt.plot([1,2,3])",
+        }
+
+    def test_make_key_normalizes_question(self):
+        self.assertEqual(
+            make_key("  Média por UF? ", "schema"),
+            make_key("média por uf?", "schema"),
+        )
+        self.assertNotEqual(
+            make_key("média por uf?", "schema"),
+            make_key("média por uf?", "other schema"),
+        )
+
+    def test_set_get_roundtrip(self):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        state = self.make_state()
+
+        wf_cache.set("key", state)
+        cached = wf_cache.get("key")
+
+        self.assertEqual(cached["query"], state["query"])
+        self.assertEqual(cached["answer"], state["answer"])
+        self.assertEqual(cached["explanation"], state["explanation"])
+        self.assertEqual(cached["dataviz_code"], state["dataviz_code"])
+        pd.testing.assert_frame_equal(cached["result"], state["result"])
+
+    def test_get_missing(self):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+
+        self.assertIsNone(wf_cache.get("missing"))
+
+    @patch('cache.diskcache', None)
+    def test_lru_eviction(self):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+
+        wf_cache.set("a", self.make_state())
+        wf_cache.set("b", self.make_state())
+        wf_cache.get("a")  # "b" becomes least recently used
+        wf_cache.set("c", self.make_state())
+
+        self.assertIsNotNone(wf_cache.get("a"))
+        self.assertIsNone(wf_cache.get("b"))
+        self.assertIsNotNone(wf_cache.get("c"))
+
+    @patch('cache.diskcache', None)
+    def test_expired_entry(self):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name, ttl=-1)
+
+        wf_cache.set("key", self.make_state())
+
+        self.assertIsNone(wf_cache.get("key"))
+
+    @unittest.skipIf(cache.diskcache is None, "diskcache not installed")
+    def test_promotes_from_disk(self):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        wf_cache.set("key", self.make_state())
+        wf_cache._memory.clear()
+
+        cached = wf_cache.get("key")
+
+        self.assertEqual(cached["query"], "SELECT * FROM test")
+        self.assertIn("key", wf_cache._memory)
+
+    def test_set_skips_unserializable_result(self):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        state = self.make_state()
+        state["result"] = "Nenhum resultado encontrado."
+
+        wf_cache.set("key", state)
+
+        self.assertIsNone(wf_cache.get("key"))
+
+
+EMBEDDINGS = {
+    "Qual a média de idade por UF?": np.array([1.0, 0.0]),
+    "Idade média por estado?": np.array([0.95, np.sqrt(1 - 0.95**2)]),  # cosine 0.95
+    "Quantos registros por sexo?": np.array([0.8, 0.6]),  # cosine 0.80
+}
+
+
+@patch('cache.diskcache', None)
+@patch('cache.embed', side_effect=lambda question: EMBEDDINGS.get(question))
+class TestSemanticCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def make_state(self, question):
+        return {
+            "schema": "Schema test",
+            "question": question,
+            "query": f"-- {question}",
+            "result": pd.DataFrame({"col": [1, 2, 3]}),
+            "answer": "Test answer",
+            "explanation": "Test explanation",
+            "dataviz_code": "plt.plot([1,2,3])",
+        }
+
+    def test_similar_question_hit(self, mock_embed):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        wf_cache.set("key", self.make_state("Qual a média de idade por UF?"))
+
+        cached = wf_cache.get_similar("Idade média por estado?", "Schema test")
+
+        self.assertEqual(cached["query"], "-- Qual a média de idade por UF?")
+        pd.testing.assert_frame_equal(cached["result"], pd.DataFrame({"col": [1, 2, 3]}))
+
+    def test_dissimilar_question_miss(self, mock_embed):
+        self.assertLess(EMBEDDINGS["Quantos registros por sexo?"][0], cache.SIMILARITY_THRESHOLD)
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        wf_cache.set("key", self.make_state("Qual a média de idade por UF?"))
+
+        self.assertIsNone(wf_cache.get_similar("Quantos registros por sexo?", "Schema test"))
+
+    def test_other_schema_miss(self, mock_embed):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        wf_cache.set("key", self.make_state("Qual a média de idade por UF?"))
+
+        self.assertIsNone(wf_cache.get_similar("Idade média por estado?", "Other schema"))
+
+    def test_unavailable_embedding_miss(self, mock_embed):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        wf_cache.set("key", self.make_state("Qual a média de idade por UF?"))
+
+        self.assertIsNone(wf_cache.get_similar("Pergunta sem embedding", "Schema test"))
+
+    def test_index_bounded_by_maxsize(self, mock_embed):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name)
+        for i, question in enumerate(EMBEDDINGS):
+            wf_cache.set(str(i), self.make_state(question))
+
+        embeddings, entries = wf_cache._semantic[cache.schema_hash("Schema test")]
+
+        self.assertEqual(embeddings.shape, (2, 2))
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[-1][1]["query"], "-- Quantos registros por sexo?")
+
+    def test_expired_entry_miss(self, mock_embed):
+        wf_cache = WorkflowCache(maxsize=2, directory=self.tmp.name, ttl=-1)
+        wf_cache.set("key", self.make_state("Qual a média de idade por UF?"))
+
+        self.assertIsNone(wf_cache.get_similar("Idade média por estado?", "Schema test"))
+
+
+class TestEmbedder(unittest.TestCase):
+
+    def tearDown(self):
+        if cache._embedder_thread is not None:
+            cache._embedder_thread.join()
+        cache._embedder = None
+        cache._embedder_failed = False
+        cache._embedder_thread = None
+        cache._encode.cache_clear()
+
+    def test_failed_load_is_not_retried(self):
+        with patch('cache.SentenceTransformer', side_effect=OSError("offline")) as mock_model:
+            self.assertIsNone(cache.load_embedder())
+            self.assertIsNone(cache.load_embedder())
+            self.assertIsNone(cache.embed("Qual a média de idade por UF?"))
+
+        mock_model.assert_called_once()
+
+    def test_embed_does_not_wait_for_loading_model(self):
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_model(name):
+            loading.set()
+            release.wait(5)
+            model = Mock()
+            model.encode.return_value = np.array([1.0, 0.0])
+            return model
+
+        with patch('cache.SentenceTransformer', side_effect=slow_model):
+            self.assertIsNone(cache.embed("Qual a média de idade por UF?"))
+            self.assertTrue(loading.wait(5))
+            # still loading in the background, semantic lookup is skipped
+            self.assertIsNone(cache.embed("Qual a média de idade por UF?"))
+
+            release.set()
+            cache._embedder_thread.join(5)
+
+            np.testing.assert_array_equal(
+                cache.embed("Qual a média de idade por UF?"), np.array([1.0, 0.0])
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
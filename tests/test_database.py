@@ -0,0 +1,59 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import limit_query, LIMIT_ROWS
+
+
+class TestLimitQuery(unittest.TestCase):
+
+    def test_keeps_existing_limit(self):
+        query = "SELECT VAR5 FROM creditRisk.train LIMIT 5"
+
+        self.assertEqual(limit_query(query), query)
+
+    def test_appends_limit(self):
+        self.assertEqual(
+            limit_query("SELECT VAR5 FROM creditRisk.train"),
+            f"SELECT VAR5 FROM creditRisk.train\nLIMIT {LIMIT_ROWS}",
+        )
+
+    def test_trailing_semicolon(self):
+        self.assertEqual(
+            limit_query("SELECT VAR5 FROM creditRisk.train;\n"),
+            f"SELECT VAR5 FROM creditRisk.train\nLIMIT {LIMIT_ROWS}",
+        )
+
+    def test_trailing_comment(self):
+        self.assertEqual(
+            limit_query("SELECT VAR5 FROM creditRisk.train -- fim"),
+            f"SELECT VAR5 FROM creditRisk.train -- fim\nLIMIT {LIMIT_ROWS}",
+        )
+
+    def test_semicolon_before_trailing_comment(self):
+        self.assertEqual(
+            limit_query("SELECT VAR5 FROM creditRisk.train; -- fim"),
+            f"SELECT VAR5 FROM creditRisk.train -- fim\nLIMIT {LIMIT_ROWS}",
+        )
+
+    def test_semicolon_before_block_comment(self):
+        self.assertEqual(
+            limit_query("SELECT VAR5 FROM creditRisk.train; /* fim */"),
+            f"SELECT VAR5 FROM creditRisk.train /* fim */\nLIMIT {LIMIT_ROWS}",
+        )
+        self.assertEqual(
+            limit_query("SELECT VAR5 FROM creditRisk.train;\n/* multi\nlinha */ -- fim"),
+            f"SELECT VAR5 FROM creditRisk.train\n/* multi\nlinha */ -- fim\nLIMIT {LIMIT_ROWS}",
+        )
+
+    def test_semicolon_in_string_literal(self):
+        self.assertEqual(
+            limit_query("SELECT ';' AS sep FROM creditRisk.train"),
+            f"SELECT ';' AS sep FROM creditRisk.train\nLIMIT {LIMIT_ROWS}",
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import pandas as pd
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from orchestrator import create_plot_figures, _compile_viz
+
+
+class TestCreatePlotFigures(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({"uf": ["SP", "RJ", "MG"], "media": [35.5, 40.0, 38.2]})
+
+    def test_accepts_plotting_code(self):
+        code = (
+            "import matplotlib.pyplot as plt\n"
+            "fig, ax = plt.subplots()\n"
+            "ax.bar(df['uf'], df['media'])\n"
+            "ax.set_title('Média por UF')\n"
+            "figs.append(fig)\n"
+        )
+
+        figs = create_plot_figures(code, self.df)
+
+        self.assertEqual(len(figs), 1)
+
+    def test_rejects_dunder_access(self):
+        with self.assertRaisesRegex(ValueError, "__class__"):
+            create_plot_figures("df.__class__", self.df)
+
+    def test_rejects_os_access(self):
+        with self.assertRaisesRegex(ValueError, "'os'"):
+            _compile_viz("import os")
+        with self.assertRaisesRegex(ValueError, "'os'"):
+            _compile_viz("pd.io.common.os.system('ls')")
+
+    def test_rejects_gateways(self):
+        for code in [
+            "np.ctypeslib.load_library('lib', '.')",
+            "from numpy import ctypeslib",
+            "pd.read_pickle('http://example.com/x.pkl')",
+            "df.query('media > 1')",
+        ]:
+            with self.subTest(code=code):
+                with self.assertRaises(ValueError):
+                    _compile_viz(code)
+
+    def test_rejects_file_and_network_io(self):
+        for name, code in [
+            ("open", "np.lib.npyio.DataSource().open('/etc/hostname').read()"),
+            ("DataSource", "DataSource = 1"),
+            ("npyio", "from numpy.lib import npyio"),
+            ("get_handle", "pd.io.common.get_handle('/etc/hostname', 'r')"),
+            ("open_memmap", "np.lib.format.open_memmap('/tmp/x.npy', mode='w+')"),
+            ("f2py", "import numpy.f2py"),
+            ("savefig", "plt.savefig('/tmp/x.png')"),
+            ("savefig", "fig, ax = plt.subplots()\nfig.savefig('/tmp/x.png')"),
+            ("imread", "plt.imread('http://example.com/x.png')"),
+            ("to_string", "df.to_string('/tmp/x.txt')"),
+        ]:
+            with self.subTest(code=code):
+                with self.assertRaisesRegex(ValueError, f"'{name}'"):
+                    _compile_viz(code)
+
+    def test_rejects_non_whitelisted_module_at_runtime(self):
+        for code in [
+            "lib = np.lib",
+            "m = pd\nm.io.common",
+            "m = plt\nm.matplotlib.image",
+        ]:
+            with self.subTest(code=code):
+                with self.assertRaisesRegex(ValueError, "module"):
+                    create_plot_figures(code, self.df)
+
+    def test_rejects_non_whitelisted_import(self):
+        with self.assertRaisesRegex(ImportError, "json"):
+            create_plot_figures("import json", self.df)
+        with self.assertRaisesRegex(ImportError, "numpy.lib"):
+            create_plot_figures("import numpy.lib", self.df)
+        with self.assertRaisesRegex(ImportError, "numpy.lib"):
+            create_plot_figures("from numpy import lib", self.df)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import viz_helpers
+from viz_helpers import groupby_mean, histogram
+
+# pure python loops (what numba compiles), numpy fallbacks and whatever is active
+IMPLEMENTATIONS = {
+    "loop": (viz_helpers._grouped_sums_loop, viz_helpers._bin_counts_loop),
+    "numpy": (viz_helpers._grouped_sums_numpy, viz_helpers._bin_counts_numpy),
+    "active": (viz_helpers._grouped_sums, viz_helpers._bin_counts),
+}
+
+
+class TestVizHelpers(unittest.TestCase):
+
+    def implementations(self):
+        for name, (grouped_sums, bin_counts) in IMPLEMENTATIONS.items():
+            with self.subTest(implementation=name), \
+                    patch('viz_helpers._grouped_sums', grouped_sums), \
+                    patch('viz_helpers._bin_counts', bin_counts):
+                yield
+
+    def assert_groupby_mean_matches(self, df):
+        expected = df.groupby("key")["value"].mean()
+        for _ in self.implementations():
+            keys, means = groupby_mean(df["key"], df["value"])
+
+            self.assertEqual(list(keys), list(expected.index))
+            np.testing.assert_allclose(means, expected.to_numpy(dtype=float, na_value=np.nan))
+
+    def assert_histogram_matches(self, values, bins=10):
+        valid = pd.Series(values).dropna().to_numpy(dtype=float)
+        valid = valid[np.isfinite(valid)]
+        expected_counts, expected_edges = np.histogram(valid, bins=bins)
+        for _ in self.implementations():
+            counts, edges = histogram(values, bins=bins)
+
+            np.testing.assert_array_equal(counts, expected_counts)
+            np.testing.assert_allclose(edges, expected_edges)
+
+    def test_groupby_mean(self):
+        df = pd.DataFrame({
+            "key": ["SP", "RJ", "SP", "MG", "RJ", "SP"],
+            "value": [30.0, 40.0, 50.0, 20.0, 42.0, 10.0],
+        })
+
+        self.assert_groupby_mean_matches(df)
+
+    def test_groupby_mean_with_nulls(self):
+        df = pd.DataFrame({
+            "key": ["SP", None, "SP", "MG", "RJ", "RJ"],
+            "value": [30.0, 40.0, np.nan, 20.0, np.nan, np.nan],
+        })
+
+        self.assert_groupby_mean_matches(df)
+
+    def test_groupby_mean_arrow_dtype(self):
+        df = pd.DataFrame({
+            "key": pd.array(["F", "M", "F", None, "M"], dtype=pd.ArrowDtype(pa.string())),
+            "value": pd.array([1, 0, None, 1, 1], dtype=pd.ArrowDtype(pa.int64())),
+        })
+
+        self.assert_groupby_mean_matches(df)
+
+    def test_histogram(self):
+        rng = np.random.default_rng(0)
+
+        self.assert_histogram_matches(rng.normal(40, 12, size=1000))
+
+    def test_histogram_max_in_last_bin(self):
+        self.assert_histogram_matches([0.0, 1.0, 2.5, 7.5, 10.0], bins=4)
+
+    def test_histogram_with_nulls(self):
+        self.assert_histogram_matches([18.0, np.nan, 25.0, 60.0, None, 33.0])
+
+    def test_histogram_with_infinities(self):
+        self.assert_histogram_matches([18.0, np.inf, 25.0, -np.inf, 60.0, np.nan, 33.0])
+
+    def test_histogram_all_infinite(self):
+        for _ in self.implementations():
+            counts, edges = histogram([np.inf, -np.inf, np.nan], bins=5)
+
+            np.testing.assert_array_equal(counts, np.zeros(5))
+            self.assertTrue(np.isfinite(edges).all())
+
+    def test_histogram_zero_width(self):
+        self.assert_histogram_matches([5.0, 5.0, 5.0])
+
+    def test_histogram_all_null(self):
+        for _ in self.implementations():
+            counts, edges = histogram([np.nan, None], bins=5)
+
+            np.testing.assert_array_equal(counts, np.zeros(5))
+            self.assertEqual(len(edges), 6)
+
+    def test_histogram_arrow_dtype(self):
+        values = pd.array([18, 25, None, 60, 33, 41], dtype=pd.ArrowDtype(pa.int64()))
+
+        self.assert_histogram_matches(values, bins=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
+import json
+import asyncio
+import decimal
 import unittest
 from unittest.mock import Mock, patch
 import pandas as pd
+import pyarrow as pa
 import os
 import sys
 
@@ -10,6 +14,10 @@ from workflow import (
     get_default_llm,
     get_default_db,
     execute_query,
+    aexecute_query,
+    format_result_for_llm,
+    build_compact_result_ctx,
+    strip_code_fence,
     handle_no_results
 )
 
@@ -17,12 +25,14 @@ from workflow import (
 class TestWorkflow(unittest.TestCase):
     
     def setUp(self):
+        get_default_llm.cache_clear()
         self.state = {
             "tables": ["creditRisk.train"],
             "schema": "Schema test",
             "question": "Test question",
             "query": "SELECT * FROM test",
             "result": pd.DataFrame({"col": [1, 2, 3]}),
+            "result_for_llm": "   col\n0    1\n1    2\n2    3",
             "answer": "Test answer",
             "explanation": "Test explanation",
             "dataviz_code": "plt.plot([1,2,3])",
@@ -59,6 +69,7 @@ class TestWorkflow(unittest.TestCase):
         
         self.assertTrue(result["has_results"])
         self.assertIsInstance(result["result"], pd.DataFrame)
+        self.assertIn("10", result["result_for_llm"])
     
     @patch('workflow.get_default_db')
     def test_execute_query_empty(self, mock_get_db):
@@ -70,6 +81,16 @@ class TestWorkflow(unittest.TestCase):
         
         self.assertFalse(result["has_results"])
     
+    @patch('workflow.get_default_db')
+    def test_execute_query_all_null(self, mock_get_db):
+        mock_db = Mock()
+        mock_db.run_query.return_value = pd.DataFrame({"a": [None, None], "b": [None, None]})
+        mock_get_db.return_value = mock_db
+        
+        result = execute_query(self.state)
+        
+        self.assertFalse(result["has_results"])
+    
     @patch('workflow.get_default_db')
     def test_execute_query_error(self, mock_get_db):
         mock_db = Mock()
@@ -81,6 +102,60 @@ class TestWorkflow(unittest.TestCase):
         self.assertFalse(result["has_results"])
         self.assertIn("Error executing query", result["result"])
     
+    def test_format_result_for_llm_small(self):
+        result = format_result_for_llm(pd.DataFrame({"col": range(3)}))
+        
+        self.assertEqual(result, pd.DataFrame({"col": range(3)}).to_string())
+    
+    def test_format_result_for_llm_summarizes_large(self):
+        result = format_result_for_llm(pd.DataFrame({"col": range(150)}))
+        
+        self.assertIn("Resumo do resultado (150 linhas)", result)
+        ctx = json.loads(result.split("\n", 1)[1])
+        self.assertEqual(ctx["row_count"], 150)
+        self.assertEqual(ctx["columns"], ["col"])
+        self.assertEqual(len(ctx["sample"]), 5)
+        self.assertEqual(ctx["describe"]["col"]["max"], 149)
+    
+    def test_compact_result_ctx_skips_failing_columns(self):
+        numeric = pd.array(
+            [decimal.Decimal("1.5"), decimal.Decimal("2.25"), None],
+            dtype=pd.ArrowDtype(pa.decimal128(38, 9)),
+        )
+        df = pd.DataFrame({"valor": numeric, "idade": [20, 30, 40]})
+        
+        ctx = json.loads(build_compact_result_ctx(df))
+        
+        self.assertEqual(ctx["columns"], ["valor", "idade"])
+        self.assertEqual(ctx["describe"]["idade"]["max"], 40)
+    
+    def test_compact_result_ctx_caps_columns(self):
+        df = pd.DataFrame({f"col{i}": range(3) for i in range(30)})
+        
+        ctx = json.loads(build_compact_result_ctx(df, max_columns=20))
+        
+        self.assertEqual(ctx["column_count"], 30)
+        self.assertEqual(ctx["columns"], [f"col{i}" for i in range(20)])
+        self.assertEqual(len(ctx["dtypes"]), 20)
+        self.assertEqual(len(ctx["sample"][0]), 20)
+        self.assertEqual(len(ctx["describe"]), 20)
+    
+    def test_aexecute_query_success(self):
+        mock_db = Mock()
+        mock_db.run_query.return_value = pd.DataFrame({"count": [10]})
+        
+        result = asyncio.run(aexecute_query(self.state, mock_db))
+        
+        mock_db.run_query.assert_called_once_with(self.state["query"])
+        self.assertTrue(result["has_results"])
+        self.assertIsInstance(result["result"], pd.DataFrame)
+    
+    def test_strip_code_fence(self):
+        self.assertEqual(strip_code_fence("```sql\nSELECT 1\n```"), "SELECT 1")
+        self.assertEqual(strip_code_fence("  ```python\nplt.plot([1])\n```  "), "plt.plot([1])")
+        self.assertEqual(strip_code_fence("```\nSELECT 1\n```\n"), "SELECT 1")
+        self.assertEqual(strip_code_fence(" SELECT 1 "), "SELECT 1")
+    
     def test_handle_no_results(self):
         result = handle_no_results(self.state)
         